@@ -0,0 +1,49 @@
+"""
+Compare route matching time of flattened and mounted blueprints as the blueprint count grows.
+
+    python benchmarks/blueprint_mount.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from madara.app import Madara
+from madara.blueprints import Blueprint
+from werkzeug.test import EnvironBuilder
+from madara.wrappers import Request
+import timeit
+
+
+def make_app(count, mount):
+    app = Madara(config={})
+    for i in range(count):
+        bp = Blueprint("bp%d" % i)
+
+        @bp.route("/item/<int:the_id>", methods=["GET", "POST"])
+        def item(request, the_id):
+            return "item"
+
+        @bp.route("/user/<name>/posts")
+        def posts(request, name):
+            return "posts"
+
+        app.register_blueprint(bp, url_prefix="/bp%d" % i, mount=mount)
+    return app
+
+
+def main():
+    print("%10s %14s %14s" % ("blueprints", "flat (us)", "mounted (us)"))
+    for count in (10, 100, 1000):
+        row = []
+        for mount in (False, True):
+            app = make_app(count, mount)
+            request = Request(EnvironBuilder(path="/bp%d/user/arvin/posts" % (count - 1)).get_environ())
+            number = 2000
+            seconds = timeit.timeit(lambda: app.match_request(request), number=number)
+            row.append(seconds / number * 1e6)
+        print("%10d %14.2f %14.2f" % (count, row[0], row[1]))
+
+
+if __name__ == "__main__":
+    main()
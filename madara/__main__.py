@@ -0,0 +1,3 @@
+from madara.cli import main
+
+main()
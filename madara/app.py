@@ -1,14 +1,24 @@
-from werkzeug.routing import Map, Rule, MapAdapter
-from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
+from werkzeug.routing import Map, Rule, MapAdapter, RequestRedirect
+from werkzeug.exceptions import HTTPException, InternalServerError, MethodNotAllowed, NotFound
 from werkzeug.datastructures import ImmutableDict
 from werkzeug.serving import run_simple
+from werkzeug.wsgi import ClosingIterator
 from madara.blueprints import Blueprint
+from madara.routing import PrefixTrie
 from madara.wrappers import Request, make_response
 from madara.utils import _endpoint_from_view_func, import_string, load_config
 from madara.compat import string_types
 from madara.log import enable_pretty_logging
+from madara.errors import ErrorReporter
+from madara.tracing import Tracer
+from madara.memory import MemoryProfiler
+from madara.memo import MemoCache, memoize_app, memoize_request, _missing
+from madara.server import serve
+from madara.tasks import TaskQueue
 import logging
-import traceback
+import threading
+import signal
+import json
 
 
 class Madara(object):
@@ -20,7 +30,25 @@ class Madara(object):
             "middlewares": [],
             "host_matching": False,
             "subdomain_matching": False,
+            "host_partitioning": False,
             "logger_handler": None,
+            "error_report_interval": 0,
+            "error_report_max_entries": 1000,
+            "error_report_endpoint": None,
+            "timeout": None,
+            "deadline_header": None,
+            "tracing_exporter": None,
+            "memory_profiling": 0,
+            "memory_profile_endpoint": None,
+            "memory_profile_signal": None,
+            "memo_maxsize": 1024,
+            "memo_ttl": 60,
+            "background_workers": 4,
+            "background_queue_size": 1000,
+            "background_overflow": "drop",
+            "background_drain_timeout": 10,
+            "background_block_timeout": 1,
+            "background_tasks_endpoint": None,
         }
     )
 
@@ -34,17 +62,51 @@ class Madara(object):
         else:
             self.logger = enable_pretty_logging(logger=logging.getLogger("madara"), handler=self.config["logger_handler"], level=logging.INFO)
         self.logger.propagate = False
+        self.error_reporter = ErrorReporter(
+            self.logger,
+            interval=self.config["error_report_interval"],
+            max_entries=self.config["error_report_max_entries"],
+        )
 
         self.url_map: Map = Map()
         self.url_map.host_matching = self.config["host_matching"]
         self.subdomain_matching = self.config["subdomain_matching"]
         self.url_rule_class = Rule
+        self.url_partitions: dict = {}
+        self.url_mounts = PrefixTrie()
         self.endpoint_map: dict = {}
+        self.timeout_map: dict = {}
+        self.memo_cache = MemoCache(maxsize=self.config["memo_maxsize"], ttl=self.config["memo_ttl"])
+        self.multipart_map: dict = {}
         self.blueprints: dict = {}
+        self.tracer = None
+        if self.config["tracing_exporter"] is not None:
+            self.tracer = Tracer(self.load_tracing_exporter(self.config["tracing_exporter"]))
         self._middleware_chain = None
         self._view_middleware = []
         self._exception_middleware = []
         self.load_middleware()
+        if self.config["error_report_endpoint"]:
+            self.add_url_rule(self.config["error_report_endpoint"], "madara.errors", self.error_report_view)
+        self.task_queue = TaskQueue(
+            workers=self.config["background_workers"],
+            max_queue=self.config["background_queue_size"],
+            overflow=self.config["background_overflow"],
+            drain_timeout=self.config["background_drain_timeout"],
+            block_timeout=self.config["background_block_timeout"],
+        )
+        if self.config["background_tasks_endpoint"]:
+            self.add_url_rule(self.config["background_tasks_endpoint"], "madara.tasks", self.background_tasks_view)
+        self.memory_profiler = None
+        if self.config["memory_profiling"]:
+            self.memory_profiler = MemoryProfiler(sample_rate=self.config["memory_profiling"])
+            if self.config["memory_profile_endpoint"]:
+                self.add_url_rule(self.config["memory_profile_endpoint"], "madara.memory", self.memory_profile_view)
+            if self.config["memory_profile_signal"]:
+                signum = self.config["memory_profile_signal"]
+                if isinstance(signum, str):
+                    signum = getattr(signal, signum)
+                signal.signal(signum, self.dump_memory_profile)
 
         if self.config["debug"]:
             self.logger.debug("madara config {}".format(self.config))
@@ -58,19 +120,41 @@ class Madara(object):
                 mw = import_string(md)
             mw_instance = mw(handler, self)
             if hasattr(mw_instance, 'process_view'):
-                self._view_middleware.insert(0, mw_instance.process_view)
+                self._view_middleware.insert(0, self.trace_middleware_method(mw_instance.process_view))
 
             if hasattr(mw_instance, 'process_exception'):
-                self._exception_middleware.append(mw_instance.process_exception)
+                self._exception_middleware.append(self.trace_middleware_method(mw_instance.process_exception))
             handler = mw_instance
+            if self.tracer:
+                handler = self.tracer.wrap_middleware(mw_instance)
 
+        if self.tracer:
+            handler = self.tracer.wrap_request(handler)
         self._middleware_chain = handler
 
-    def add_url_rule(self, pattern: str, endpoint=None, view_func=None, provide_automatic_options=None, **options):
+    @staticmethod
+    def load_tracing_exporter(exporter):
+        if isinstance(exporter, str):
+            exporter = import_string(exporter)
+        if isinstance(exporter, type):
+            exporter = exporter()
+        return exporter
+
+    def trace_middleware_method(self, method):
+        if self.tracer:
+            return self.tracer.wrap_method(method)
+        return method
+
+    def add_url_rule(self, pattern: str, endpoint=None, view_func=None, provide_automatic_options=None, url_map=None, **options):
         if endpoint is None:
             endpoint = _endpoint_from_view_func(view_func)
         options["endpoint"] = endpoint
         methods = options.pop("methods", None)
+        timeout = options.pop("timeout", None)
+        multipart_limits = {}
+        for key in ("max_part_size", "max_parts", "spool_threshold"):
+            if key in options:
+                multipart_limits[key] = options.pop(key)
 
         # if the methods are not given and the view_func object knows its
         # methods we can use that instead.  If neither exists, we go with
@@ -105,15 +189,24 @@ class Madara(object):
         rule = self.url_rule_class(pattern, methods=methods, **options)
         rule.provide_automatic_options = provide_automatic_options
 
-        self.url_map.add(rule)
+        if url_map is None:
+            url_map = self.get_url_map(rule)
+        url_map.add(rule)
         if view_func is not None:
             old_func = self.endpoint_map.get(endpoint)
-            if old_func is not None and old_func != view_func:
+            if old_func is not None and getattr(old_func, "traced_func", old_func) != view_func:
                 raise AssertionError(
                     "View function mapping is overwriting an "
                     "existing endpoint function: %s" % endpoint
                 )
+            # blueprint entries are not wrapped, Blueprint.register wraps the blueprint's own views
+            if self.tracer and not isinstance(getattr(view_func, "__self__", None), Blueprint):
+                view_func = self.tracer.wrap_view(endpoint, view_func)
             self.endpoint_map[endpoint] = view_func
+        if timeout is not None:
+            self.timeout_map[endpoint] = timeout
+        if multipart_limits:
+            self.multipart_map[endpoint] = multipart_limits
 
     def route(self, pattern: str, **options):
         def decorator(func):
@@ -123,6 +216,18 @@ class Madara(object):
 
         return decorator
 
+    def memoize(self, scope="app", ttl=_missing):
+        """
+        Memoize a helper function. With the app scope results are shared by all requests in
+        memo_cache, expiring after ttl seconds (memo_ttl by default, never if None). With the request scope the
+        first argument of the function must be the request, and results live as long as the request.
+        """
+        if scope == "request":
+            return memoize_request
+        if scope != "app":
+            raise ValueError("Unknown memoize scope %r, expected 'app' or 'request'." % scope)
+        return memoize_app(self.memo_cache, ttl)
+
     def register_blueprint(self, blueprint: Blueprint, **options):
 
         if blueprint.name in self.blueprints:
@@ -136,28 +241,142 @@ class Madara(object):
             self.blueprints[blueprint.name] = blueprint
         blueprint.register(self, options)
 
-    def dispatch_request(self, request):
+    def get_url_map(self, rule):
+        """
+        Return the map a rule should be added to. With host partitioning enabled, rules with a
+        static host (or subdomain) go to a per-host partition map, dynamic ones stay in url_map.
+        """
+        if not self.config["host_partitioning"]:
+            return self.url_map
+        if self.url_map.host_matching:
+            key = rule.host or ""
+        elif self.subdomain_matching:
+            key = rule.subdomain if rule.subdomain is not None else self.url_map.default_subdomain
+        else:
+            return self.url_map
+        if "<" in key:
+            return self.url_map
+        url_map = self.url_partitions.get(key)
+        if url_map is None:
+            url_map = Map(
+                default_subdomain=self.url_map.default_subdomain,
+                host_matching=self.url_map.host_matching,
+                converters=self.url_map.converters,
+            )
+            self.url_partitions[key] = url_map
+        return url_map
+
+    def mount_url_map(self, url_prefix):
+        """
+        Return the map mounted at url_prefix, creating it on first use.
+        """
+        assert "<" not in url_prefix, "Only static url prefixes can be mounted: %s" % url_prefix
+        url_map = self.url_mounts.get(url_prefix)
+        if url_map is None:
+            url_map = Map(
+                default_subdomain=self.url_map.default_subdomain,
+                host_matching=self.url_map.host_matching,
+                converters=self.url_map.converters,
+            )
+            self.url_mounts.insert(url_prefix, url_map)
+        return url_map
+
+    def remove_url_partition(self, key):
+        """
+        Remove the partition of a host (or subdomain) at runtime, together with the endpoints
+        only routed by it. Return the removed map, or None if there is no such partition.
+        """
+        url_map = self.url_partitions.pop(key, None)
+        if url_map is None:
+            return None
+        endpoints = set(rule.endpoint for rule in url_map.iter_rules())
+        for other in [self.url_map] + list(self.url_partitions.values()) + list(self.url_mounts.values()):
+            endpoints -= set(rule.endpoint for rule in other.iter_rules())
+        for endpoint in endpoints:
+            self.endpoint_map.pop(endpoint, None)
+            self.timeout_map.pop(endpoint, None)
+            self.multipart_map.pop(endpoint, None)
+            for blueprint in self.blueprints.values():
+                blueprint.endpoint_map.pop(endpoint, None)
+        return url_map
+
+    def _partition_key(self, request):
+        host = request.host.lower()
+        if self.url_map.host_matching:
+            return host
+        server_name = self.config["server_name"]
+        if server_name is None:
+            return self.url_map.default_subdomain
+        cur_server_name = host.split(".")
+        real_server_name = server_name.lower().split(".")
+        offset = -len(real_server_name)
+        if cur_server_name[offset:] != real_server_name:
+            return None
+        return ".".join(filter(None, cur_server_name[:offset]))
+
+    def bind_url_map(self, url_map, request) -> MapAdapter:
         if not self.subdomain_matching:
-            subdomain = self.url_map.default_subdomain or None
+            subdomain = url_map.default_subdomain or None
         else:
             subdomain = None
-        adapter: MapAdapter = self.url_map.bind_to_environ(request.environ, server_name=self.config["server_name"], subdomain=subdomain)
+        return url_map.bind_to_environ(request.environ, server_name=self.config["server_name"], subdomain=subdomain)
+
+    def match_request(self, request):
+        """
+        Match the request against the blueprint mounted at the longest prefix of its path first,
+        then against its host partition selected by hash lookup, then against the global url_map.
+
+        A rule matching in any of them wins over a redirect or a method mismatch in an earlier one,
+        so mounts and partitions never change which rule a request matches.
+        """
+        url_maps = []
+        if self.url_mounts:
+            url_maps.append(self.url_mounts.lookup(request.path))
+        if self.url_partitions:
+            url_maps.append(self.url_partitions.get(self._partition_key(request)))
+        url_maps.append(self.url_map)
+        redirect = None
+        valid_methods = set()
+        for url_map in url_maps:
+            if url_map is None:
+                continue
+            try:
+                return self.bind_url_map(url_map, request).match()
+            except RequestRedirect as e:
+                redirect = redirect or e
+            except MethodNotAllowed as e:
+                valid_methods.update(e.valid_methods or ())
+            except NotFound:
+                pass
+        if redirect is not None:
+            raise redirect
+        if valid_methods:
+            raise MethodNotAllowed(valid_methods=sorted(valid_methods))
+        raise NotFound()
+
+    def dispatch_request(self, request):
         try:
-            endpoint, view_kwargs = adapter.match()
+            endpoint, view_kwargs = self.match_request(request)
             endpoint_func = self.endpoint_map.get(endpoint, None)
             if not endpoint_func:
                 raise NotFound()
             request.endpoint, request.view_args = endpoint, view_kwargs
-            rv = self.process_view_by_middleware(request, endpoint_func, view_kwargs)
-            if rv is None:
-                rv = endpoint_func(request, **view_kwargs)
-            return self.make_response(request, rv)
+            timeout = self.timeout_map.get(endpoint, self.config["timeout"])
+            if timeout is not None:
+                request.set_timeout(timeout)
+            multipart_limits = self.multipart_map.get(endpoint)
+            if multipart_limits is not None:
+                request.multipart_limits = multipart_limits
+            request.check_deadline()
+            if self.memory_profiler is not None:
+                return self.memory_profiler.profile(endpoint, self.call_view, request, endpoint_func, view_kwargs)
+            return self.call_view(request, endpoint_func, view_kwargs)
         except HTTPException as e:
             return e
         except Exception as e:
             if not self._exception_middleware:
                 # if no exception process middleware log the traceback.
-                self.logger.error(traceback.format_exc())
+                self.error_reporter.report()
             try:
                 rv = self.process_exception_by_middleware(request, e)
                 if rv is None:
@@ -165,9 +384,16 @@ class Madara(object):
                 return self.make_response(request, rv)
             except Exception as re:
                 # if exception process middleware raise a exception, log the traceback and return an InternalServerError.
-                self.logger.error(traceback.format_exc())
+                self.error_reporter.report()
                 return InternalServerError(original_exception=e)
 
+    def call_view(self, request, endpoint_func, view_kwargs):
+        rv = self.process_view_by_middleware(request, endpoint_func, view_kwargs)
+        if rv is None:
+            request.check_deadline()
+            rv = endpoint_func(request, **view_kwargs)
+        return self.make_response(request, rv)
+
     def process_view_by_middleware(self, request, callback, callback_kwargs):
         """
         Pass the request and view_func、view_kwargs to the view middleware.
@@ -194,16 +420,33 @@ class Madara(object):
     def make_response(self, request, rv):
         return make_response(request, rv)
 
+    def error_report_view(self, request):
+        return {
+            "errors": self.error_reporter.snapshot(),
+        }
+
+    def memory_profile_view(self, request):
+        return self.memory_profiler.stats()
+
+    def dump_memory_profile(self, signum=None, frame=None):
+        # the signal may interrupt the profiler while it holds its lock, dump from another thread
+        threading.Thread(target=self.log_memory_profile, daemon=True).start()
+
+    def log_memory_profile(self):
+        self.logger.info("memory profile {}".format(json.dumps(self.memory_profiler.stats(), indent=2)))
+
     def wsgi_app(self, environ, start_response):
         request = Request(environ)
         try:
+            if self.config["deadline_header"]:
+                request.set_deadline_from_header(self.config["deadline_header"])
             response = self._middleware_chain(request)
-            return response(environ, start_response)
+            return self.close_response(request, response(environ, start_response))
         except Exception as e:
             # process middleware chain __call__ error
             response = self.make_response(request, InternalServerError(original_exception=e))
             if not self._exception_middleware:
-                self.logger.error(traceback.format_exc())
+                self.error_reporter.report()
             else:
                 # process exception by middleware
                 try:
@@ -212,11 +455,46 @@ class Madara(object):
                         response = self.make_response(request, rv)
                 except Exception as re:
                     response = self.make_response(request, InternalServerError(original_exception=e))
-            return response(environ, start_response)
+            return self.close_response(request, response(environ, start_response))
+
+    def close_response(self, request, app_iter):
+        # callbacks and tasks may still be added while a streamed body is iterated
+        return ClosingIterator(app_iter, lambda: self.close_request(request))
+
+    def close_request(self, request):
+        for callback in request.close_callbacks:
+            try:
+                callback()
+            except Exception:
+                self.logger.exception("request close callback {} failed".format(callback))
+        request.close_callbacks = []
+        self.submit_background_tasks(request)
+
+    def submit_background_tasks(self, request):
+        """
+        Submit the background tasks of a request, a task the queue refuses is logged and skipped
+        since no view is left to handle the error.
+        """
+        tasks, request.background_tasks = request.background_tasks, []
+        for func, args, kwargs in tasks:
+            try:
+                self.task_queue.submit(func, *args, **kwargs)
+            except Exception as e:
+                self.logger.warning("background task {} not submitted: {!r}".format(func, e))
+
+    def background_tasks_view(self, request):
+        return self.task_queue.stats()
 
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)
 
-    def run(self, host="0.0.0.0", port=5000):
+    def run(self, host="0.0.0.0", port=5000, server="werkzeug", **options):
+        """
+        Serve the app with werkzeug's development server, or with server="madara" the included
+        selector based HTTP/1.1 server, options are passed to madara.server.Server.
+        """
+        if server == "madara":
+            serve(self, host, port, **options)
+            return
         is_debug = True if self.config.get("debug", False) else False
         run_simple(host, port, self, use_debugger=is_debug, use_reloader=False)
@@ -0,0 +1,233 @@
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from werkzeug.serving import make_server, WSGIRequestHandler
+from madara.wrappers import Request
+from madara.utils import import_string
+from http.client import HTTPConnection
+import threading
+import logging
+import random
+import math
+import time
+import json
+
+
+logger = logging.getLogger("madara.bench")
+
+
+class BenchRequest(object):
+    """
+    A request of the benchmark mix, picked with a probability proportional to its weight.
+    """
+
+    def __init__(self, method="GET", path="/", weight=1, body=None, headers=None):
+        self.method = method.upper()
+        self.path = path
+        self.weight = weight
+        self.headers = headers or {}
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            self.headers.setdefault("Content-Type", "application/json")
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.name = "%s %s" % (self.method, self.path)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parse a ``[METHOD] PATH [*WEIGHT]`` spec, such as ``POST /item/1 *3``.
+        """
+        parts = spec.split()
+        weight = 1
+        if len(parts) > 1 and parts[-1].startswith("*"):
+            weight = float(parts.pop()[1:])
+        if len(parts) == 1:
+            parts.insert(0, "GET")
+        if len(parts) != 2:
+            raise ValueError("invalid request spec: %r" % spec)
+        return cls(parts[0], parts[1], weight)
+
+    def environ(self):
+        return EnvironBuilder(path=self.path, method=self.method, headers=self.headers, data=self.body).get_environ()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def load_app(import_path):
+    """
+    Load a Madara app from an import path such as ``example.app``, in the same way middlewares are loaded.
+    """
+    app = import_string(import_path)
+    if isinstance(app, type):
+        app = app()
+    return app
+
+
+def endpoint_of(app, bench_request):
+    """
+    Return the endpoint a request is routed to, or its method and path if it does not match.
+    """
+    try:
+        endpoint, _ = app.match_request(Request(bench_request.environ()))
+        return endpoint
+    except Exception:
+        return bench_request.name
+
+
+def percentile(latencies, p):
+    """
+    Nearest-rank percentile of sorted latencies.
+    """
+    if not latencies:
+        return None
+    index = max(0, min(len(latencies) - 1, math.ceil(p / 100.0 * len(latencies)) - 1))
+    return latencies[index]
+
+
+class Bench(object):
+    """
+    Drive an app with a mix of requests from concurrent threads, either in-process through
+    ``wsgi_app`` or over a local socket, and collect the latencies per endpoint.
+    """
+
+    def __init__(self, app, requests, total=1000, concurrency=1, warmup=0, over_socket=False, seed=None):
+        self.app = app
+        self.requests = requests
+        self.total = total
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.over_socket = over_socket
+        self.seed = seed
+        self.names = {id(r): endpoint_of(app, r) for r in requests}
+        self._lock = threading.Lock()
+        self._issued = 0
+
+    def _next(self):
+        with self._lock:
+            if self._issued >= self.total:
+                return False
+            self._issued += 1
+            return True
+
+    def _call_in_process(self, bench_request):
+        app_iter, status, headers = run_wsgi_app(self.app.wsgi_app, bench_request.environ())
+        try:
+            for _ in app_iter:
+                pass
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+        return int(status.split(" ", 1)[0])
+
+    def _worker(self, index, results, port):
+        try:
+            self._run_worker(index, results, port)
+        except BaseException:
+            # never leave the other clients waiting on the barrier
+            self._barrier.abort()
+            raise
+
+    def _run_worker(self, index, results, port):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        weights = [r.weight for r in self.requests]
+        connection = HTTPConnection("127.0.0.1", port) if port else None
+
+        def call(bench_request):
+            """
+            Send a request and return its status, or None if it failed with an exception.
+            """
+            try:
+                if connection is None:
+                    return self._call_in_process(bench_request)
+                connection.request(bench_request.method, bench_request.path, body=bench_request.body, headers=bench_request.headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except Exception as e:
+                logger.debug("%s failed: %r", bench_request.name, e)
+                if connection is not None:
+                    # reconnect on the next request
+                    connection.close()
+                return None
+
+        for _ in range(self.warmup):
+            call(rng.choices(self.requests, weights)[0])
+        self._barrier.wait()
+        while self._next():
+            bench_request = rng.choices(self.requests, weights)[0]
+            start = time.perf_counter()
+            status = call(bench_request)
+            results.append((self.names[id(bench_request)], status, time.perf_counter() - start))
+        if connection is not None:
+            connection.close()
+
+    def run(self):
+        server = port = None
+        if self.over_socket:
+            server = make_server("127.0.0.1", 0, self.app, threaded=True, request_handler=QuietRequestHandler)
+            port = server.server_port
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        results = []
+        self._issued = 0
+        self._barrier = threading.Barrier(self.concurrency + 1)
+        workers = [threading.Thread(target=self._worker, args=(i, results, port), daemon=True) for i in range(self.concurrency)]
+        try:
+            for worker in workers:
+                worker.start()
+            try:
+                self._barrier.wait()
+            except threading.BrokenBarrierError:
+                raise RuntimeError("A benchmark client failed before the benchmark started.")
+            start = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if server is not None:
+                server.shutdown()
+        return self.summarize(results, elapsed)
+
+    def summarize(self, results, elapsed):
+        groups = {}
+        for name, status, latency in results:
+            groups.setdefault(name, []).append((status, latency))
+        groups["total"] = [(status, latency) for _, status, latency in results]
+
+        endpoints = {}
+        for name, samples in groups.items():
+            latencies = sorted(latency for _, latency in samples)
+            errors = sum(1 for status, _ in samples if status is None or status >= 500)
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": errors,
+                "throughput": len(samples) / elapsed if elapsed else None,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1] if latencies else None,
+            }
+        return {
+            "mode": "socket" if self.over_socket else "in-process",
+            "concurrency": self.concurrency,
+            "elapsed": elapsed,
+            "endpoints": endpoints,
+        }
+
+
+def format_report(report):
+    def ms(value):
+        return "-" if value is None else "%.3f" % (value * 1000)
+
+    lines = [
+        "mode: %s, concurrency: %d, elapsed: %.3fs" % (report["mode"], report["concurrency"], report["elapsed"]),
+        "%-32s %9s %7s %10s %9s %9s %9s %9s" % ("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"),
+    ]
+    for name, stats in sorted(report["endpoints"].items(), key=lambda item: item[0] == "total"):
+        lines.append("%-32s %9d %7d %10.1f %9s %9s %9s %9s" % (
+            name, stats["requests"], stats["errors"], stats["throughput"] or 0,
+            ms(stats["p50"]), ms(stats["p95"]), ms(stats["p99"]), ms(stats["max"])))
+    return "\n".join(lines)
@@ -21,6 +21,16 @@ class BlueprintSetupState(object):
             url_prefix = self.blueprint.url_prefix
         self.url_prefix = url_prefix
 
+        timeout = self.options.get("timeout")
+        if timeout is None:
+            timeout = self.blueprint.timeout
+        self.timeout = timeout
+
+        # mounted blueprints get their own url map behind the app's prefix trie
+        self.url_map = None
+        if self.options.get("mount") and self.url_prefix:
+            self.url_map = self.app.mount_url_map(self.url_prefix)
+
     def add_url_rule(self, pattern, endpoint=None, view_func=None, **options):
         if self.url_prefix is not None:
             if pattern:
@@ -29,6 +39,8 @@ class BlueprintSetupState(object):
                 pattern = self.url_prefix
 
         options.setdefault("subdomain", self.subdomain)
+        if self.timeout is not None:
+            options.setdefault("timeout", self.timeout)
 
         if endpoint is None:
             endpoint = _endpoint_from_view_func(view_func)
@@ -37,16 +49,18 @@ class BlueprintSetupState(object):
             pattern,
             "%s.%s" % (self.blueprint.name, endpoint),
             view_func,
+            url_map=self.url_map,
             **options
         )
 
 
 class Blueprint(object):
 
-    def __init__(self, name, url_prefix=None, subdomain=None):
+    def __init__(self, name, url_prefix=None, subdomain=None, timeout=None):
         self.name = name
         self.url_prefix = url_prefix
         self.subdomain = subdomain
+        self.timeout = timeout
         self.deferred_functions = []
         self._middleware_chain = None
         self._view_middleware = []
@@ -78,16 +92,24 @@ class Blueprint(object):
                 mw = import_string(md)
             mw_instance = mw(handler, app)
             if hasattr(mw_instance, 'process_view'):
-                self._view_middleware.insert(0, mw_instance.process_view)
+                self._view_middleware.insert(0, app.trace_middleware_method(mw_instance.process_view))
 
             if hasattr(mw_instance, 'process_exception'):
-                self._exception_middleware.append(mw_instance.process_exception)
+                self._exception_middleware.append(app.trace_middleware_method(mw_instance.process_exception))
             handler = mw_instance
+            if app.tracer:
+                handler = app.tracer.wrap_middleware(mw_instance)
         self._middleware_chain = handler
+        # wrap the blueprint views in spans
+        if app.tracer:
+            for endpoint, view_func in self.endpoint_map.items():
+                if not hasattr(view_func, "traced_func"):
+                    self.endpoint_map[endpoint] = app.tracer.wrap_view(endpoint, view_func)
 
     def view_entry(self, request, **view_args):
         originl_exception = None
         rv = None
+        request.check_deadline()
         try:
             rv = self._middleware_chain(request)
         except Exception as e:
@@ -113,6 +135,7 @@ class Blueprint(object):
                 raise NotFound()
             rv = self.process_view_by_middleware(request, endpoint_func, view_kwargs)
             if rv is None:
+                request.check_deadline()
                 rv = endpoint_func(request, **view_kwargs)
         except HTTPException as e:
             rv = e
@@ -0,0 +1,57 @@
+from madara.bench import Bench, BenchRequest, load_app, format_report
+import argparse
+import json
+import sys
+import os
+
+
+def bench(args):
+    app = load_app(args.app)
+    requests = [BenchRequest.parse(spec) for spec in args.request]
+    if args.mix:
+        with open(args.mix, encoding="utf-8") as f:
+            requests.extend(BenchRequest(**item) for item in json.load(f))
+    if not requests:
+        requests = [BenchRequest()]
+    report = Bench(
+        app,
+        requests,
+        total=args.requests,
+        concurrency=args.concurrency,
+        warmup=args.warmup,
+        over_socket=args.socket,
+        seed=args.seed,
+    ).run()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="madara")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    bench_parser = subparsers.add_parser("bench", help="benchmark an app in-process or over a local socket")
+    bench_parser.add_argument("app", help="import path of the app, such as example.app")
+    bench_parser.add_argument("-r", "--request", action="append", default=[],
+                              help="request of the mix as '[METHOD] PATH [*WEIGHT]', repeatable")
+    bench_parser.add_argument("--mix", help="json file of requests with method, path, weight, body and headers")
+    bench_parser.add_argument("-n", "--requests", type=int, default=1000, help="total number of requests")
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=1, help="number of concurrent clients")
+    bench_parser.add_argument("--warmup", type=int, default=0, help="requests per client before measuring")
+    bench_parser.add_argument("--socket", action="store_true", help="serve the app on a local socket instead of calling wsgi_app")
+    bench_parser.add_argument("--seed", type=int, help="seed of the request mix")
+    bench_parser.add_argument("--json", action="store_true", help="output the report as json")
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    # like `python -m`, import the app from the current directory
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
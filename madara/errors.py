@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import atexit
+import traceback
+import time
+import sys
+
+
+class ErrorReporter(object):
+    """
+    Log exceptions deduplicated by fingerprint (exception type and traceback frames).
+
+    The first occurrence of an error is logged with its full traceback, later occurrences are only
+    counted and logged as an aggregated count at most once per interval, by a background thread
+    once a storm is over. The most recent distinct errors are kept in a bounded table.
+    """
+
+    def __init__(self, logger, interval=60, max_entries=1000):
+        self.logger = logger
+        self.interval = interval
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @staticmethod
+    def fingerprint(exc_type, tb):
+        frames = tuple((frame.f_code.co_filename, lineno) for frame, lineno in traceback.walk_tb(tb))
+        key = repr((exc_type.__module__, exc_type.__qualname__, frames)).encode("utf-8")
+        return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+    def report(self, exc_info=None):
+        """
+        Report an exception, the one currently being handled by default. With a zero interval every
+        occurrence is logged in full.
+        """
+        exc_type, exc_value, tb = exc_info or sys.exc_info()
+        if exc_type is None:
+            return
+
+        key = self.fingerprint(exc_type, tb)
+        now = time.time()
+        pending = 0
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {
+                    "fingerprint": key,
+                    "type": "%s.%s" % (exc_type.__module__, exc_type.__qualname__),
+                    "message": str(exc_value),
+                    "count": 1,
+                    "pending": 0,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "last_logged": now,
+                }
+                self.entries[key] = entry
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                log_full = True
+            else:
+                self.entries.move_to_end(key)
+                entry["count"] += 1
+                entry["last_seen"] = now
+                entry["message"] = str(exc_value)
+                log_full = not self.interval
+                if not log_full:
+                    entry["pending"] += 1
+                    if now - entry["last_logged"] >= self.interval:
+                        pending, entry["pending"], entry["last_logged"] = entry["pending"], 0, now
+
+        if not log_full and self._flusher is None:
+            self._start_flusher()
+        if log_full:
+            self.logger.error("[%s] %s" % (key, "".join(traceback.format_exception(exc_type, exc_value, tb))))
+        elif pending:
+            self._log_repeated(entry, pending)
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name="madara-error-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Log the aggregated counts of all errors not logged yet.
+        """
+        now = time.time()
+        with self._lock:
+            flushed = []
+            for entry in self.entries.values():
+                if entry["pending"]:
+                    flushed.append((entry, entry["pending"]))
+                    entry["pending"], entry["last_logged"] = 0, now
+        for entry, pending in flushed:
+            self._log_repeated(entry, pending)
+
+    def _log_repeated(self, entry, pending):
+        self.logger.error("[%s] %s: %s repeated %d times (%d in total)" % (
+            entry["fingerprint"], entry["type"], entry["message"], pending, entry["count"]))
+
+    def snapshot(self):
+        """
+        Return the recent distinct errors, most recent first.
+        """
+        with self._lock:
+            return [dict(entry) for entry in reversed(self.entries.values())]
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+import functools
+import threading
+import time
+
+_missing = object()
+
+
+def func_name(func):
+    return "%s.%s" % (func.__module__, func.__qualname__)
+
+
+def make_key(func, args, kwargs):
+    """
+    Build the cache key of a call, a tuple of the qualified name of the function, its arguments and
+    keyword arguments. Arguments must be hashable, they are compared by value and kept alive by the
+    cache, so an object is never confused with another one reusing its address.
+    """
+    key = (func_name(func), args, frozenset(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError as e:
+        raise TypeError("Arguments of memoized function %s must be hashable: %s" % (key[0], e)) from e
+    return key
+
+
+def key_name(key):
+    """
+    The name of a key used for prefix invalidation, the function name of call keys and the string
+    form of other keys.
+    """
+    return str(key[0] if isinstance(key, tuple) else key)
+
+
+class MemoCache(object):
+    """
+    A thread-safe TTL and LRU cache. Concurrent misses of a key compute its value only once.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def _lookup(self, key):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is _missing:
+                return _missing
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return _missing
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _missing else value
+
+    def set(self, key, value, ttl=_missing):
+        if ttl is _missing:
+            ttl = self.ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, func, ttl=_missing):
+        """
+        Return the cached value of key, or compute it with func() and cache it. Only one thread
+        computes a missing key, the others wait for its result.
+        """
+        value = self._lookup(key)
+        if value is not _missing:
+            return value
+        with self._lock:
+            lock = self._inflight.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                value = self._lookup(key)
+                if value is not _missing:
+                    return value
+                with self._lock:
+                    self.misses += 1
+                value = func()
+                self.set(key, value, ttl)
+                return value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is lock:
+                    del self._inflight[key]
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, _missing) is not _missing
+
+    def invalidate(self, prefix="", exact=False):
+        """
+        Remove the keys whose name (the function name of memoized calls) starts with prefix, or is
+        prefix if exact, all keys by default. Return how many were removed.
+        """
+        with self._lock:
+            if exact:
+                keys = [key for key in self._data if key_name(key) == prefix]
+            else:
+                keys = [key for key in self._data if key_name(key).startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+def memoize_app(cache, ttl=_missing):
+    """
+    Decorate a function to cache its results in cache, shared by all requests.
+    """
+    def decorator(func):
+        name = func_name(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(func, args, kwargs)
+            return cache.get_or_set(key, lambda: func(*args, **kwargs), ttl)
+
+        wrapper.invalidate = lambda *args, **kwargs: cache.delete(make_key(func, args, kwargs))
+        wrapper.invalidate_all = lambda: cache.invalidate(name, exact=True)
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def memoize_request(func):
+    """
+    Decorate a function taking the request as first argument to cache its results on the request,
+    they are freed when the response is closed.
+    """
+    @functools.wraps(func)
+    def wrapper(request, *args, **kwargs):
+        memo = request.memo
+        key = make_key(func, args, kwargs)
+        value = memo.get(key, _missing)
+        if value is _missing:
+            value = memo[key] = func(request, *args, **kwargs)
+        return value
+
+    return wrapper
@@ -0,0 +1,107 @@
+import threading
+import tracemalloc
+import linecache
+import fnmatch
+import random
+
+
+class MemoryProfiler(object):
+    """
+    Attribute memory allocations to endpoints with tracemalloc.
+
+    A sampled subset of requests runs between two tracemalloc snapshots, their net allocations and
+    peak memory are aggregated per endpoint and per allocation site. Tracing is only started around
+    a sampled request, so other requests run at full speed, unless it was already started elsewhere.
+    Only one request is profiled at a time, allocations made by concurrent requests in other threads
+    are still counted with it.
+    """
+
+    def __init__(self, sample_rate=0.01, frames=1, top_sites=10):
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.top_sites = top_sites
+        self.endpoints = {}
+        self._profiling = threading.Lock()
+        self._lock = threading.Lock()
+        self._filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, fnmatch.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+
+    def profile(self, endpoint, func, *args, **kwargs):
+        """
+        Call func, profiling its allocations under endpoint if the request is sampled.
+        """
+        if random.random() >= self.sample_rate or not self._profiling.acquire(blocking=False):
+            return func(*args, **kwargs)
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.frames)
+        try:
+            before = tracemalloc.take_snapshot().filter_traces(self._filters)
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1] - current
+                after = tracemalloc.take_snapshot().filter_traces(self._filters)
+                self._record(endpoint, after.compare_to(before, "lineno"), peak)
+        finally:
+            if started:
+                tracemalloc.stop()
+            self._profiling.release()
+
+    def _record(self, endpoint, stats, peak):
+        with self._lock:
+            entry = self.endpoints.get(endpoint)
+            if entry is None:
+                entry = self.endpoints[endpoint] = {
+                    "requests": 0,
+                    "net_bytes": 0,
+                    "max_peak_bytes": 0,
+                    "sites": {},
+                }
+            entry["requests"] += 1
+            entry["max_peak_bytes"] = max(entry["max_peak_bytes"], peak)
+            for stat in stats:
+                if not stat.size_diff:
+                    continue
+                entry["net_bytes"] += stat.size_diff
+                frame = stat.traceback[0]
+                site = "%s:%d" % (frame.filename, frame.lineno)
+                size, count = entry["sites"].get(site, (0, 0))
+                entry["sites"][site] = (size + stat.size_diff, count + stat.count_diff)
+
+    def _top_sites(self, sites):
+        top = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:self.top_sites]
+        return [{"site": site, "net_bytes": size, "net_blocks": count} for site, (size, count) in top]
+
+    def stats(self):
+        """
+        Return the aggregated allocations per endpoint and the top allocation sites overall.
+        """
+        with self._lock:
+            endpoints = {}
+            sites = {}
+            for endpoint, entry in self.endpoints.items():
+                endpoints[endpoint] = {
+                    "requests": entry["requests"],
+                    "net_bytes": entry["net_bytes"],
+                    "avg_net_bytes": entry["net_bytes"] // entry["requests"],
+                    "max_peak_bytes": entry["max_peak_bytes"],
+                    "top_sites": self._top_sites(entry["sites"]),
+                }
+                for site, (size, count) in entry["sites"].items():
+                    total_size, total_count = sites.get(site, (0, 0))
+                    sites[site] = (total_size + size, total_count + count)
+            return {
+                "endpoints": endpoints,
+                "top_sites": self._top_sites(sites),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
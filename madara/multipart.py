@@ -0,0 +1,155 @@
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, Field, File, NeedData
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from tempfile import SpooledTemporaryFile
+
+
+class MultipartPart(object):
+    """
+    A part of a streamed multipart body.
+
+    The data of a part can be streamed once with ``iter_chunks()`` or ``save()`` while it is the
+    current part. Otherwise it is spooled, in memory up to the spool threshold and then to a
+    temporary file, and can be read through ``file``.
+    """
+
+    def __init__(self, reader, event):
+        self.name = event.name
+        self.filename = event.filename if isinstance(event, File) else None
+        self.headers = event.headers
+        self.content_type = event.headers.get("content-type")
+        self.size = 0
+        self._reader = reader
+        self._spool = None
+        self._streamed = False
+        self._finished = False
+
+    def iter_chunks(self):
+        """
+        Yield the data of the part chunk by chunk, without buffering it whole.
+        """
+        if self._spool is not None:
+            self._spool.seek(0)
+            yield from iter(lambda: self._spool.read(self._reader.buffer_size), b"")
+            return
+        if self._streamed:
+            raise RuntimeError("The data of part %r was already streamed." % self.name)
+        self._streamed = True
+        yield from self._reader._iter_data(self)
+
+    def save(self, dst):
+        """
+        Stream the data of the part to a path or a writable file object, return the written size.
+        """
+        if isinstance(dst, str):
+            with open(dst, "wb") as f:
+                return self.save(f)
+        size = 0
+        for chunk in self.iter_chunks():
+            dst.write(chunk)
+            size += len(chunk)
+        return size
+
+    @property
+    def file(self):
+        """
+        The spooled data of the part as a file object.
+        """
+        self._spool_remaining()
+        self._spool.seek(0)
+        return self._spool
+
+    def read(self):
+        return b"".join(self.iter_chunks())
+
+    @property
+    def value(self):
+        """
+        The data of the part decoded as text, mostly useful for form fields.
+        """
+        _, options = parse_options_header(self.content_type)
+        return self.read().decode(options.get("charset", "utf-8"), "replace")
+
+    def _spool_remaining(self):
+        if self._spool is not None:
+            return
+        if self._streamed:
+            raise RuntimeError("The data of part %r was already streamed." % self.name)
+        self._streamed = True
+        self._spool = SpooledTemporaryFile(max_size=self._reader.spool_threshold)
+        for chunk in self._reader._iter_data(self):
+            self._spool.write(chunk)
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+
+    def __repr__(self):
+        return "<MultipartPart %r %r>" % (self.name, self.filename)
+
+
+class MultipartReader(object):
+    """
+    Parse a multipart body incrementally from a stream, yielding its parts as they arrive.
+    Exceeding max_part_size or max_parts raises a 413 RequestEntityTooLarge.
+    """
+
+    def __init__(self, stream, boundary, max_part_size=None, max_parts=None, spool_threshold=500 * 1024, buffer_size=64 * 1024):
+        self.stream = stream
+        self.max_part_size = max_part_size
+        self.max_parts = max_parts
+        self.spool_threshold = spool_threshold
+        self.buffer_size = buffer_size
+        self.parts = []
+        self._decoder = MultipartDecoder(boundary, max_parts=max_parts)
+        self._eof = False
+
+    def _next_event(self):
+        while True:
+            try:
+                event = self._decoder.next_event()
+            except ValueError as e:
+                raise BadRequest(str(e))
+            if not isinstance(event, NeedData):
+                return event
+            if self._eof:
+                raise BadRequest("Unexpected end of multipart body.")
+            data = self.stream.read(self.buffer_size)
+            if not data:
+                self._eof = True
+                data = None
+            self._decoder.receive_data(data)
+
+    def _iter_data(self, part):
+        while not part._finished:
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise BadRequest("Unexpected multipart event %r." % event)
+            part.size += len(event.data)
+            if self.max_part_size is not None and part.size > self.max_part_size:
+                raise RequestEntityTooLarge()
+            part._finished = not event.more_data
+            if event.data:
+                yield event.data
+
+    def __iter__(self):
+        while True:
+            if self.parts and not self.parts[-1]._finished:
+                # the current part was not streamed to its end, keep the rest of it
+                part = self.parts[-1]
+                if part._spool is None and not part._streamed:
+                    part._spool_remaining()
+                else:
+                    for _ in self._iter_data(part):
+                        pass
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, (Field, File)):
+                part = MultipartPart(self, event)
+                self.parts.append(part)
+                yield part
+
+    def close(self):
+        for part in self.parts:
+            part.close()
@@ -0,0 +1,49 @@
+class PrefixTrie(object):
+    """
+    A trie of url prefixes keyed by path segment, used to find the longest mounted prefix of a path.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+
+    @staticmethod
+    def _segments(path):
+        return [segment for segment in path.split("/") if segment]
+
+    def insert(self, prefix, value):
+        node = self
+        for segment in self._segments(prefix):
+            node = node.children.setdefault(segment, PrefixTrie())
+        node.value = value
+
+    def get(self, prefix):
+        node = self
+        for segment in self._segments(prefix):
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node.value
+
+    def lookup(self, path):
+        """
+        Descend the trie segment by segment and return the value of the longest prefix of path, or None.
+        """
+        node = self
+        value = self.value
+        for segment in self._segments(path):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.value is not None:
+                value = node.value
+        return value
+
+    def values(self):
+        if self.value is not None:
+            yield self.value
+        for child in self.children.values():
+            yield from child.values()
+
+    def __bool__(self):
+        return self.value is not None or bool(self.children)
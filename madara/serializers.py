@@ -0,0 +1,105 @@
+from json import dumps, loads
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+class Serializer(object):
+    """
+    Encode and decode response and request bodies of some mimetypes, the first one is used for responses.
+    """
+
+    mimetypes = ()
+
+    @property
+    def mimetype(self):
+        return self.mimetypes[0]
+
+    def dumps(self, data) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, raw: bytes):
+        raise NotImplementedError()
+
+
+class JSONSerializer(Serializer):
+
+    mimetypes = ("application/json",)
+
+    def dumps(self, data):
+        return (dumps(data, indent=None, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def loads(self, raw):
+        return loads(raw)
+
+
+class MsgPackSerializer(Serializer):
+
+    mimetypes = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, raw):
+        return msgpack.unpackb(raw, raw=False)
+
+
+class CBORSerializer(Serializer):
+
+    mimetypes = ("application/cbor",)
+
+    def dumps(self, data):
+        return cbor2.dumps(data)
+
+    def loads(self, raw):
+        return cbor2.loads(raw)
+
+
+class SerializerRegistry(object):
+    """
+    Serializers by mimetype, negotiated from the Accept header for responses and picked from the
+    Content-Type header for requests. The first registered serializer is the default one.
+    """
+
+    def __init__(self):
+        self.serializers = []
+        self._by_mimetype = {}
+
+    def register(self, serializer: Serializer):
+        self.serializers.append(serializer)
+        for mimetype in serializer.mimetypes:
+            self._by_mimetype.setdefault(mimetype, serializer)
+
+    @property
+    def default(self) -> Serializer:
+        return self.serializers[0]
+
+    def get(self, mimetype):
+        return self._by_mimetype.get(mimetype)
+
+    def negotiate(self, accept_mimetypes):
+        """
+        Return the serializer and mimetype best matching an Accept header, any registered mimetype
+        of a serializer can match. Fall back to the default serializer if none is acceptable.
+        """
+        default = (self.default, self.default.mimetype)
+        if not accept_mimetypes:
+            return default
+        best = accept_mimetypes.best_match(list(self._by_mimetype))
+        if best is None:
+            return default
+        return self._by_mimetype[best], best
+
+serializers = SerializerRegistry()
+serializers.register(JSONSerializer())
+if msgpack is not None:
+    serializers.register(MsgPackSerializer())
+if cbor2 is not None:
+    serializers.register(CBORSerializer())
@@ -0,0 +1,558 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from email.utils import formatdate
+from urllib.parse import unquote_to_bytes
+from io import BytesIO
+import selectors
+import logging
+import socket
+import queue
+import time
+import sys
+
+logger = logging.getLogger("madara.server")
+
+_HEX_DIGITS = b"0123456789abcdefABCDEF"
+
+_STATUS_REASONS = {
+    400: "Bad Request",
+    408: "Request Timeout",
+    413: "Request Entity Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    505: "HTTP Version Not Supported",
+}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class HTTPRequest(object):
+
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.body = b""
+
+    def header(self, name, default=None):
+        for key, value in self.headers:
+            if key == name:
+                return value
+        return default
+
+    @property
+    def keep_alive(self):
+        connection = (self.header("connection") or "").lower()
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+
+class Connection(object):
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.buffer = bytearray()
+        self.out = bytearray()
+        # parsed requests waiting for the one being handled, in order
+        self.pending = deque()
+        self.request = None
+        self.body_remaining = 0
+        self.chunked = None
+        self.busy = False
+        self.reading = True
+        self.close_after = False
+        self.closed = False
+        self.last_active = time.monotonic()
+        self.events = 0
+
+
+class Server(object):
+    """
+    A dependency-free HTTP/1.1 server for WSGI apps.
+
+    A single thread accepts connections and reads and writes them with a selector, parsing
+    persistent and pipelined requests. Parsed requests run on a bounded pool of worker threads,
+    one at a time per connection so that pipelined responses are sent in order. Response bodies are
+    buffered by the worker before being written.
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=8000, workers=16, backlog=1024, max_header_size=64 * 1024,
+                 max_body_size=100 * 1024 * 1024, max_pipeline=16, idle_timeout=75, shutdown_timeout=30,
+                 read_size=64 * 1024):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.backlog = backlog
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.max_pipeline = max_pipeline
+        self.idle_timeout = idle_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.read_size = read_size
+        self.connections = set()
+        self._selector = None
+        self._executor = None
+        self._done = queue.SimpleQueue()
+        self._running = False
+        self._last_sweep = 0
+        self.socket = None
+        self._wake_r = self._wake_w = None
+
+    def bind(self):
+        if self.socket is not None:
+            return
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.setblocking(False)
+        self.socket = sock
+        self.port = sock.getsockname()[1]
+
+    def serve_forever(self):
+        self.bind()
+        self._selector = selectors.DefaultSelector()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="madara-worker")
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self.socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._wakeup)
+        self._running = True
+        logger.info("madara server listening on http://%s:%d", self.host, self.port)
+        try:
+            while self._running:
+                for key, events in self._selector.select(timeout=1):
+                    key.data(key.fileobj, events)
+                self._drain_done()
+                self._close_idle()
+        finally:
+            self._drain()
+            self._executor.shutdown(wait=True)
+            self._selector.close()
+            self.socket = None
+            wake_r, wake_w = self._wake_r, self._wake_w
+            self._wake_r = self._wake_w = None
+            wake_r.close()
+            wake_w.close()
+
+    def _drain(self):
+        """
+        Stop accepting and reading, then let in-flight requests finish and their responses be
+        written, up to shutdown_timeout seconds. Pipelined requests not started yet are dropped.
+        """
+        self._selector.unregister(self.socket)
+        self.socket.close()
+        for conn in list(self.connections):
+            conn.reading = False
+            conn.pending.clear()
+            conn.buffer.clear()
+            if not conn.busy and not conn.out:
+                self._close(conn)
+                continue
+            conn.close_after = True
+            self._update_events(conn)
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.connections and time.monotonic() < deadline:
+            for key, events in self._selector.select(timeout=min(1, max(0, deadline - time.monotonic()))):
+                key.data(key.fileobj, events)
+            self._drain_done()
+        for conn in list(self.connections):
+            self._close(conn)
+
+    def shutdown(self):
+        """
+        Stop serve_forever() from another thread, in-flight requests are finished and their
+        responses sent first.
+        """
+        self._running = False
+        self._wake()
+
+    def _wake(self):
+        wake_w = self._wake_w
+        if wake_w is None:
+            return
+        try:
+            wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _wakeup(self, sock, events):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _accept(self, sock, events):
+        for _ in range(self.backlog):
+            try:
+                client, addr = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.warning("accept failed: %s", e)
+                return
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(client, addr)
+            self.connections.add(conn)
+            self._update_events(conn)
+
+    def _update_events(self, conn):
+        if conn.closed:
+            return
+        events = 0
+        if conn.reading and not conn.close_after and len(conn.pending) < self.max_pipeline:
+            events |= selectors.EVENT_READ
+        if conn.out:
+            events |= selectors.EVENT_WRITE
+        if events == conn.events:
+            return
+        if conn.events == 0:
+            self._selector.register(conn.sock, events, lambda sock, ev, conn=conn: self._handle(conn, ev))
+        elif events == 0:
+            self._selector.unregister(conn.sock)
+        else:
+            self._selector.modify(conn.sock, events, lambda sock, ev, conn=conn: self._handle(conn, ev))
+        conn.events = events
+
+    def _handle(self, conn, events):
+        try:
+            if events & selectors.EVENT_READ:
+                self._read(conn)
+            if not conn.closed and events & selectors.EVENT_WRITE:
+                self._write(conn)
+        except Exception:
+            # one bad connection must never stop the selector loop
+            logger.exception("error handling connection from %s", conn.addr[0])
+            self._close(conn)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(self.read_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        if not data:
+            # the client closed its side, finish the requests already received
+            conn.reading = False
+            if not conn.busy and not conn.pending and not conn.out:
+                self._close(conn)
+            else:
+                self._update_events(conn)
+            return
+        conn.last_active = time.monotonic()
+        conn.buffer.extend(data)
+        self._feed(conn)
+        self._next_request(conn)
+        self._update_events(conn)
+
+    def _feed(self, conn):
+        """
+        Parse the buffered requests, an invalid one is queued as its error response.
+        """
+        try:
+            self._parse(conn)
+        except HTTPError as e:
+            conn.pending.append(e)
+            conn.reading = False
+            conn.buffer.clear()
+
+    def _parse(self, conn):
+        # requests beyond max_pipeline stay in the buffer until earlier ones are answered
+        while conn.buffer and len(conn.pending) < self.max_pipeline:
+            if conn.request is None:
+                end = conn.buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    if len(conn.buffer) > self.max_header_size:
+                        raise HTTPError(431)
+                    return
+                if end > self.max_header_size:
+                    raise HTTPError(431)
+                head = bytes(conn.buffer[:end])
+                del conn.buffer[:end + 4]
+                self._parse_head(conn, head)
+            if conn.chunked is not None:
+                if not self._parse_chunks(conn):
+                    return
+            else:
+                if len(conn.buffer) < conn.body_remaining:
+                    return
+                conn.request.body = bytes(conn.buffer[:conn.body_remaining])
+                del conn.buffer[:conn.body_remaining]
+            conn.pending.append(conn.request)
+            conn.request = None
+            conn.chunked = None
+
+    def _parse_head(self, conn, head):
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            raise HTTPError(400)
+        method, target, version = parts
+        if not version.startswith("HTTP/1."):
+            raise HTTPError(505)
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep or not name or name != name.strip() or line[0] in " \t":
+                raise HTTPError(400)
+            headers.append((name.lower(), value.strip()))
+        request = HTTPRequest(method, target, version, headers)
+
+        transfer_encoding = (request.header("transfer-encoding") or "").lower()
+        content_length = request.header("content-length")
+        if transfer_encoding:
+            if transfer_encoding != "chunked" or content_length is not None:
+                raise HTTPError(501 if transfer_encoding != "chunked" else 400)
+            conn.chunked = bytearray()
+            conn.body_remaining = 0
+        elif content_length is not None:
+            if not (content_length.isascii() and content_length.isdigit()):
+                raise HTTPError(400)
+            conn.body_remaining = int(content_length)
+            if self.max_body_size is not None and conn.body_remaining > self.max_body_size:
+                raise HTTPError(413)
+        else:
+            conn.body_remaining = 0
+        conn.request = request
+
+        expect = (request.header("expect") or "").lower()
+        if expect == "100-continue" and (conn.chunked is not None or conn.body_remaining) and not conn.busy and not conn.pending:
+            conn.out.extend(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+    def _parse_chunks(self, conn):
+        """
+        Move the complete chunks of a chunked body from the buffer, return True at its end.
+        """
+        buffer = conn.buffer
+        while True:
+            line_end = buffer.find(b"\r\n")
+            if line_end < 0:
+                if len(buffer) > self.max_header_size:
+                    raise HTTPError(400)
+                return False
+            size = bytes(buffer[:line_end]).split(b";", 1)[0].strip()
+            if not size or size.strip(_HEX_DIGITS):
+                raise HTTPError(400)
+            size = int(size, 16)
+            if size == 0:
+                # skip the trailers up to the final blank line
+                if buffer[line_end + 2:line_end + 4] == b"\r\n":
+                    del buffer[:line_end + 4]
+                else:
+                    end = buffer.find(b"\r\n\r\n", line_end + 2)
+                    if end < 0:
+                        return False
+                    del buffer[:end + 4]
+                conn.request.body = bytes(conn.chunked)
+                return True
+            start = line_end + 2
+            if len(buffer) < start + size + 2:
+                return False
+            if buffer[start + size:start + size + 2] != b"\r\n":
+                raise HTTPError(400)
+            conn.chunked.extend(buffer[start:start + size])
+            del buffer[:start + size + 2]
+            if self.max_body_size is not None and len(conn.chunked) > self.max_body_size:
+                raise HTTPError(413)
+
+    def _next_request(self, conn):
+        if conn.busy or conn.close_after or not conn.pending:
+            return
+        request = conn.pending.popleft()
+        if isinstance(request, HTTPError):
+            conn.out.extend(self._error_response(request.status))
+            conn.close_after = True
+            return
+        conn.busy = True
+        environ = self._environ(conn, request)
+        self._executor.submit(self._run_app, conn, request, environ)
+
+    def _environ(self, conn, request):
+        target = request.target
+        if "://" in target:
+            target = "/" + target.split("://", 1)[1].partition("/")[2]
+        path, _, query = target.partition("?")
+        host = request.header("host") or self.host
+        environ = {
+            "REQUEST_METHOD": request.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote_to_bytes(path).decode("latin-1"),
+            "QUERY_STRING": query,
+            "REQUEST_URI": request.target,
+            "RAW_URI": request.target,
+            "SERVER_NAME": host.rsplit(":", 1)[0] if not host.endswith("]") else host,
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": request.version,
+            "REMOTE_ADDR": conn.addr[0],
+            "REMOTE_PORT": str(conn.addr[1]),
+            "CONTENT_LENGTH": str(len(request.body)) if request.body else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": BytesIO(request.body),
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in request.headers:
+            if "_" in name:
+                # ambiguous with "-" once converted, drop it like other wsgi servers
+                continue
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name in ("content-length", "transfer-encoding"):
+                continue
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+                if key in environ:
+                    value = environ[key] + "," + value
+                environ[key] = value
+        return environ
+
+    def _run_app(self, conn, request, environ):
+        try:
+            data, keep_alive = self._call_app(request, environ)
+        except Exception:
+            logger.exception("error handling %s %s", request.method, request.target)
+            data, keep_alive = self._error_response(500), False
+        self._done.put((conn, data, keep_alive))
+        self._wake()
+
+    def _call_app(self, request, environ):
+        response = []
+        body = []
+
+        def start_response(status, headers, exc_info=None):
+            # the body is buffered, so headers can always be replaced on error
+            response[:] = [status, headers]
+            return body.append
+
+        app_iter = self.app(environ, start_response)
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    body.append(chunk)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+        if not response:
+            raise RuntimeError("The app did not call start_response.")
+
+        status, headers = response
+        code = int(status[:3])
+        keep_alive = request.keep_alive and self._running
+        lines = ["HTTP/1.1 %s" % status]
+        has_length = False
+        for name, value in headers:
+            lower = name.lower()
+            if lower == "connection":
+                if value.lower() == "close":
+                    keep_alive = False
+                continue
+            if lower == "transfer-encoding":
+                continue
+            if lower == "content-length":
+                has_length = True
+            lines.append("%s: %s" % (name, value))
+        body_allowed = code >= 200 and code not in (204, 304)
+        if not body_allowed or request.method == "HEAD":
+            body = []
+        if body_allowed and not has_length:
+            lines.append("Content-Length: %d" % sum(len(chunk) for chunk in body))
+        lines.append("Date: %s" % formatdate(usegmt=True))
+        if not keep_alive:
+            lines.append("Connection: close")
+        elif request.version == "HTTP/1.0":
+            lines.append("Connection: keep-alive")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        return b"".join([head] + body), keep_alive
+
+    def _error_response(self, status):
+        reason = _STATUS_REASONS.get(status, "Error")
+        body = ("%d %s\n" % (status, reason)).encode("ascii")
+        return ("HTTP/1.1 %d %s\r\nContent-Type: text/plain\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % (
+            status, reason, len(body))).encode("ascii") + body
+
+    def _drain_done(self):
+        while True:
+            try:
+                conn, data, keep_alive = self._done.get_nowait()
+            except queue.Empty:
+                return
+            if conn.closed:
+                continue
+            conn.busy = False
+            conn.out.extend(data)
+            if not keep_alive:
+                conn.close_after = True
+            elif conn.buffer:
+                self._feed(conn)
+            self._next_request(conn)
+            self._write(conn)
+
+    def _write(self, conn):
+        if conn.out:
+            try:
+                sent = conn.sock.send(conn.out)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self._close(conn)
+                return
+            del conn.out[:sent]
+            conn.last_active = time.monotonic()
+        if not conn.out and not conn.busy:
+            if conn.close_after or (not conn.reading and not conn.pending):
+                self._close(conn)
+                return
+        self._update_events(conn)
+
+    def _close_idle(self):
+        now = time.monotonic()
+        if not self.idle_timeout or now - self._last_sweep < 1:
+            return
+        self._last_sweep = now
+        deadline = now - self.idle_timeout
+        for conn in list(self.connections):
+            if not conn.busy and not conn.out and conn.last_active < deadline:
+                self._close(conn)
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.connections.discard(conn)
+        if conn.events:
+            self._selector.unregister(conn.sock)
+            conn.events = 0
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+
+def serve(app, host="127.0.0.1", port=8000, **options):
+    """
+    Serve a WSGI app with the madara HTTP/1.1 server until interrupted.
+    """
+    server = Server(app, host, port, **options)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,172 @@
+import threading
+import logging
+import atexit
+import queue
+import time
+
+logger = logging.getLogger("madara")
+
+OVERFLOW_POLICIES = ("drop", "block", "run", "raise")
+
+
+class TaskQueueFull(Exception):
+    """
+    Raised by TaskQueue.submit() when the queue is full and the overflow policy is "raise".
+    """
+
+
+class TaskQueue(object):
+    """
+    Run background tasks on a bounded pool of worker threads.
+
+    When the queue is full the overflow policy decides what happens to a new task: "drop" discards
+    it, "block" waits up to block_timeout seconds for a free slot and then drops it, "run" runs it
+    in the calling thread and "raise" raises TaskQueueFull. Queued tasks are drained on shutdown, which also runs at interpreter exit.
+    """
+
+    def __init__(self, workers=4, max_queue=1000, overflow="drop", drain_timeout=10, block_timeout=1):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %r, expected one of %s." % (overflow, ", ".join(OVERFLOW_POLICIES)))
+        self.workers = workers
+        self.overflow = overflow
+        self.drain_timeout = drain_timeout
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.durations = {}
+
+    def _start(self):
+        with self._lock:
+            if self._threads or self._closed:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name="madara-task-%d" % i, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.shutdown)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs), return False if the task was dropped.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit a task to a task queue that was shut down.")
+        if not self._threads:
+            self._start()
+        task = (func, args, kwargs)
+        try:
+            if self.overflow == "block":
+                self._queue.put(task, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(task)
+        except queue.Full:
+            if self.overflow == "run":
+                self._run(task)
+                return True
+            with self._lock:
+                self.dropped += 1
+            if self.overflow == "raise":
+                raise TaskQueueFull()
+            logger.warning("background task queue is full, dropped %s" % _task_name(func))
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _work(self):
+        while True:
+            if self._closed:
+                # after shutdown a worker exits once the queue is empty, sentinel or not
+                try:
+                    task = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+            else:
+                task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._run(task)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, task):
+        func, args, kwargs = task
+        name = _task_name(func)
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            failed = True
+            logger.exception("background task %s failed" % name)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                count, total, maximum = self.durations.get(name, (0, 0.0, 0.0))
+                self.durations[name] = (count + 1, total + duration, max(maximum, duration))
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stop accepting tasks and let the workers drain the queue, waiting up to timeout seconds
+        (drain_timeout by default) if wait is True.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        for _ in threads:
+            # the sentinels only wake idle workers, busy ones exit on their own once the queue is empty
+            try:
+                if wait:
+                    self._queue.put(None, timeout=max(0, deadline - time.monotonic()))
+                else:
+                    self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        if not wait:
+            return
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in threads):
+            logger.warning("background task queue not drained after shutdown timeout, %d tasks left" % self._queue.qsize())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "workers": self.workers,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "durations": {
+                    name: {
+                        "count": count,
+                        "avg": total / count,
+                        "max": maximum,
+                    } for name, (count, total, maximum) in self.durations.items()
+                },
+            }
+
+
+def _task_name(func):
+    return "%s.%s" % (getattr(func, "__module__", None), getattr(func, "__qualname__", type(func).__name__))
@@ -0,0 +1,171 @@
+from collections import deque
+import time
+import os
+
+
+class Span(object):
+    """
+    A timed operation of a request, identified in the w3c trace context format.
+    """
+
+    def __init__(self, name, trace_id=None, parent_id=None, sampled=True):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+        self.attributes = {}
+
+    @property
+    def traceparent(self):
+        """
+        The traceparent header value to propagate this span to downstream services.
+        """
+        return "00-%s-%s-%s" % (self.trace_id, self.span_id, "01" if self.sampled else "00")
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def __repr__(self):
+        return "<Span %s %s/%s %r>" % (self.name, self.trace_id, self.span_id, self.duration)
+
+
+def parse_traceparent(value):
+    """
+    Parse a w3c traceparent header, return (trace_id, parent_id, sampled) or None if it is invalid.
+    """
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id.lower(), parent_id.lower(), sampled
+
+
+class SpanExporter(object):
+    """
+    Receive the finished spans, subclass it to send them to a tracing backend.
+    """
+
+    def export(self, span):
+        raise NotImplementedError()
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    Keep the most recent finished spans in a ring buffer, mostly useful for tests.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.spans = deque(maxlen=maxlen)
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def get_finished_spans(self):
+        return list(self.spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+class Tracer(object):
+    """
+    Wrap middlewares and views of a middleware chain in spans. The current span is kept on the
+    request as ``request.trace_span``, wrappers keep the wrapped callable as ``traced_func``.
+    """
+
+    header = "traceparent"
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def _trace(self, name, func, request, *args, **kwargs):
+        parent = request.trace_span
+        if parent is None:
+            span = Span(name)
+        else:
+            span = Span(name, trace_id=parent.trace_id, parent_id=parent.span_id, sampled=parent.sampled)
+        return self._run(span, parent, func, request, *args, **kwargs)
+
+    def _run(self, span, parent, func, request, *args, **kwargs):
+        request.trace_span = span
+        start = time.perf_counter()
+        try:
+            return func(request, *args, **kwargs)
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            request.trace_span = parent
+            if span.sampled:
+                self.exporter.export(span)
+
+    def wrap(self, name, func):
+        """
+        Return a callable running func(request, ...) in a span child of the request's current span.
+        """
+        def wrapper(request, *args, **kwargs):
+            return self._trace(name, func, request, *args, **kwargs)
+
+        wrapper.traced_func = func
+        return wrapper
+
+    def wrap_request(self, func):
+        """
+        Return a callable running func(request) in the root span of the request, continuing the
+        trace of an incoming traceparent header if any.
+        """
+        def wrapper(request):
+            context = parse_traceparent(request.headers.get(self.header))
+            if context is None:
+                span = Span("request")
+            else:
+                trace_id, parent_id, sampled = context
+                span = Span("request", trace_id=trace_id, parent_id=parent_id, sampled=sampled)
+            span.attributes.update({
+                "http.method": request.method,
+                "http.path": request.path,
+            })
+            return self._run(span, None, handle, request)
+
+        def handle(request):
+            # recorded before the span finishes so that exporters see it
+            response = func(request)
+            request.trace_span.attributes["http.status_code"] = getattr(response, "status_code", None)
+            return response
+
+        wrapper.traced_func = func
+        return wrapper
+
+    def wrap_middleware(self, mw_instance):
+        return self.wrap("%s.__call__" % type(mw_instance).__name__, mw_instance)
+
+    def wrap_method(self, method):
+        return self.wrap("%s.%s" % (type(method.__self__).__name__, method.__name__), method)
+
+    def wrap_view(self, endpoint, view_func):
+        return self.wrap("view %s (%s)" % (endpoint, getattr(view_func, "__qualname__", type(view_func).__name__)), view_func)
@@ -1,9 +1,13 @@
 from werkzeug.wrappers import Request as __request_base
 from werkzeug.wrappers import Response as __response_base
 from werkzeug.datastructures import Headers
+from werkzeug.exceptions import GatewayTimeout, BadRequest, UnsupportedMediaType
 from madara.compat import text_type
-from madara.utils import reraise, jsonify
+from madara.utils import reraise
+from madara.multipart import MultipartReader
+from madara.serializers import serializers
 import typing as t
+import time
 import sys
 
 
@@ -11,12 +15,131 @@ class Request(__request_base):
 
     view_args: t.Optional[t.Dict[str, t.Any]] = None
     endpoint: t.Optional[str] = None
+    #: monotonic time at which the request should be abandoned, None means no deadline
+    deadline: t.Optional[float] = None
+    #: the current tracing span, only set when tracing is enabled
+    trace_span = None
+    #: default limits of iter_parts(), set from the route options
+    multipart_limits: t.Dict[str, t.Any] = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.start_time = time.monotonic()
+        self.close_callbacks = []
+        self.background_tasks = []
+        self._memo = None
+
+    def call_on_close(self, func):
+        """
+        Register a function to call once the response has been sent and closed.
+        """
+        self.close_callbacks.append(func)
+        return func
+
+    def add_background_task(self, func, *args, **kwargs):
+        """
+        Schedule func(*args, **kwargs) to run on the app's task queue after the response has been sent.
+        """
+        self.background_tasks.append((func, args, kwargs))
+
+    @property
+    def memo(self) -> dict:
+        """
+        Values memoized for the lifetime of the request, freed when the response is closed.
+        """
+        if self._memo is None:
+            self._memo = {}
+            self.call_on_close(self._memo.clear)
+        return self._memo
+
+    @property
+    def remaining(self) -> t.Optional[float]:
+        """
+        Seconds left before the deadline, None if the request has no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def set_timeout(self, timeout: float):
+        """
+        Bound the deadline to timeout seconds from the start of the request, a deadline already
+        set by an earlier budget is only shortened.
+        """
+        deadline = self.start_time + timeout
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def set_deadline_from_header(self, name: str):
+        """
+        Take the remaining budget in seconds from the given request header, invalid values are ignored.
+        """
+        value = self.headers.get(name)
+        if value is None:
+            return
+        try:
+            timeout = float(value)
+        except ValueError:
+            return
+        self.set_timeout(timeout)
+
+    def iter_parts(self, **limits) -> MultipartReader:
+        """
+        Stream a multipart/form-data body part by part instead of parsing the whole form.
+        Limits are max_part_size, max_parts and spool_threshold, by default the ones of the route.
+        """
+        if self.mimetype != "multipart/form-data":
+            raise BadRequest("Expected a multipart/form-data body.")
+        boundary = self.mimetype_params.get("boundary")
+        if not boundary:
+            raise BadRequest("Missing multipart boundary.")
+        options = dict(self.multipart_limits)
+        options.update(limits)
+        reader = MultipartReader(self.stream, boundary.encode("latin-1"), **options)
+        # spooled parts are kept until the response is closed
+        self.call_on_close(reader.close)
+        return reader
+
+    def get_payload(self, silent=False):
+        """
+        Decode the body with the serializer of its Content-Type, json by default. Raise a 415 for an
+        unsupported Content-Type and a 400 for an invalid body, or return None if silent.
+        """
+        serializer = serializers.get(self.mimetype) if self.mimetype else serializers.default
+        if serializer is None:
+            if silent:
+                return None
+            raise UnsupportedMediaType()
+        try:
+            return serializer.loads(self.get_data(cache=True))
+        except Exception as e:
+            if silent:
+                return None
+            raise BadRequest("Failed to decode %s body: %s" % (serializer.mimetype, e))
+
+    def check_deadline(self):
+        """
+        Raise a 504 GatewayTimeout if the deadline of the request has passed.
+        """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise GatewayTimeout()
 
 
 class Response(__response_base):
     pass
 
 
+def serialize(request, data) -> Response:
+    """
+    Encode data with the serializer negotiated from the Accept header of the request.
+    """
+    serializer, mimetype = serializers.negotiate(request.accept_mimetypes)
+    rv = Response(serializer.dumps(data), mimetype=mimetype)
+    if len(serializers.serializers) > 1:
+        rv.vary.add("Accept")
+    return rv
+
+
 def make_response(request, *rv) -> Response:
 
     if not rv:
@@ -64,8 +187,8 @@ def make_response(request, *rv) -> Response:
             # special logic
             rv = Response(rv, status=status, headers=headers)
             status = headers = None
-        elif isinstance(rv, dict):
-            rv = jsonify(rv)
+        elif isinstance(rv, (dict, list)):
+            rv = serialize(request, rv)
         elif isinstance(rv, Response) or callable(rv):
             # evaluate a WSGI callable, or coerce a different response
             # class to the correct type
@@ -74,7 +197,7 @@ def make_response(request, *rv) -> Response:
             except TypeError as e:
                 new_error = TypeError(
                     "{e}\nThe view function did not return a valid"
-                    " response. The return type must be a string, dict, tuple,"
+                    " response. The return type must be a string, dict, list, tuple,"
                     " Response instance, or WSGI callable, but it was a"
                     " {rv.__class__.__name__}.".format(e=e, rv=rv)
                 )
@@ -82,7 +205,7 @@ def make_response(request, *rv) -> Response:
         else:
             raise TypeError(
                 "The view function did not return a valid"
-                " response. The return type must be a string, dict, tuple,"
+                " response. The return type must be a string, dict, list, tuple,"
                 " Response instance, or WSGI callable, but it was a"
                 " {rv.__class__.__name__}.".format(rv=rv)
             )
@@ -19,7 +19,12 @@ setup_args = dict(
     url='https://github.com/Arvintian/madara',
     author_email='arvintian8@gamil.com',
     packages=find_packages(),
-    include_package_data=True
+    include_package_data=True,
+    entry_points={
+        "console_scripts": [
+            "madara = madara.cli:main",
+        ],
+    },
 )
 
 if 'setuptools' in sys.modules: